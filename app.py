@@ -3,12 +3,10 @@ Simple admin/test script for VCET RAG Chatbot
 This is useful for quick testing without using the web interface
 """
 
-import os
-from dotenv import load_dotenv
+from config import Config
 from src.search import RAGSearch
 from utils.logger import setup_logger
 
-load_dotenv()
 logger = setup_logger(__name__)
 
 def main():
@@ -19,8 +17,8 @@ def main():
     
     # Initialize RAG
     print("Initializing RAG system...")
-    embedding_model = os.getenv("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5")
-    llm_model = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+    embedding_model = Config.EMBEDDING_MODEL
+    llm_model = Config.LLM_MODEL
     
     try:
         rag_search = RAGSearch(
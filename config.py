@@ -3,11 +3,15 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def env_flag(name: str, default: str = 'False') -> bool:
+    """Boolean env var: 1/true/yes/on (any case) enable it, anything else disables it"""
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
 class Config:
     """Application configuration"""
     # Flask
     SECRET_KEY = os.getenv('SECRET_KEY', 'vcet-rag-chatbot-secret-key-2024')
-    DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
+    DEBUG = env_flag('DEBUG')
     
     # Groq API
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
@@ -15,6 +19,10 @@ class Config:
     # Models
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'BAAI/bge-base-en-v1.5')
     LLM_MODEL = os.getenv('LLM_MODEL', 'llama-3.3-70b-versatile')
+    # INT8 ONNX encoder directory from scripts/quantize_embedding_model.py (unset = FP32)
+    EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR')
+    # Compile the FP32 embedding model with torch.compile at startup
+    TORCH_COMPILE = env_flag('TORCH_COMPILE')
     
     # Paths
     DATA_DIR = 'data'
@@ -24,11 +32,35 @@ class Config:
     TOP_K_RESULTS = int(os.getenv('TOP_K_RESULTS', '5'))
     CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1000'))
     CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '200'))
+    # Token budget for retrieved context sent to the LLM (prefill latency scales with it)
+    MAX_CONTEXT_TOKENS = int(os.getenv('MAX_CONTEXT_TOKENS', '2000'))
+    # Read the whole Faiss index once after loading it
+    WARM_FAISS = env_flag('WARM_FAISS')
+    
+    # Faiss index built by /api/rebuild-index (auto, flat, hnsw or ivfpq) and its search knobs
+    FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'auto').lower()
+    FAISS_EF_SEARCH = int(os.getenv('FAISS_EF_SEARCH', '64'))
+    FAISS_NPROBE = int(os.getenv('FAISS_NPROBE', '8'))
+    
+    # Native thread pools for batch-1 inference on small instances
+    FAISS_THREADS = int(os.getenv('FAISS_THREADS', '1'))
+    # Also sizes ONNX Runtime's intra/inter-op pools when the INT8 encoder is used
+    TORCH_THREADS = int(os.getenv('TORCH_THREADS', '1'))
+    
+    # Warm the RAG system in a background thread at startup (server-optimized.py)
+    EAGER_WARM = env_flag('EAGER_WARM')
+    # Requests wait this long for warm-up, kept well under gunicorn's 120 s worker timeout
+    RAG_INIT_TIMEOUT = float(os.getenv('RAG_INIT_TIMEOUT', '60'))
     
     # Rate Limiting
-    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    RATE_LIMIT_ENABLED = env_flag('RATE_LIMIT_ENABLED', 'True')
     MAX_REQUESTS_PER_MINUTE = int(os.getenv('MAX_REQUESTS_PER_MINUTE', '30'))
     
+    # Response compression (flask-compress)
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIN_SIZE = 512
+    COMPRESS_STREAMS = False  # leave /api/query/stream events unbuffered
+    
     # CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*')
     
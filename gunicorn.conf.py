@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for server.py
+- One worker: the rate limiter, query cache, stats and loaded index are
+  in-process state, so extra workers would each keep their own copy
+  (per-worker limits, stale cache/index after clear or rebuild)
+- Threads provide the concurrency; retrieval is micro-batched across them
+- preload_app loads the embedding model and Faiss index in the master, so
+  a restarted worker forks from it instead of reloading from disk
+- Command-line flags (Procfile, railway.toml, nixpacks.toml) override these
+"""
+
+import os
+import sys
+from config import Config
+
+preload_app = True
+workers = 1
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = 120
+
+def post_fork(server, worker):
+    """Keep each worker's torch pool at batch-1 size"""
+    # RAGSearch already pins threads in the master before fork; re-apply per
+    # worker so no worker inherits a larger pool. Skip if torch isn't loaded
+    # (RAG system not initialized yet) rather than importing it just for this.
+    if "torch" in sys.modules:
+        import torch
+        torch.set_num_threads(Config.TORCH_THREADS)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Export the embedding model to ONNX and quantize it to INT8
+Run once at build time, then point EMBEDDING_ONNX_DIR at the output folder
+
+Usage: python scripts/quantize_embedding_model.py [model_name] [output_dir]
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5")
+DEFAULT_OUTPUT_DIR = os.getenv("EMBEDDING_ONNX_DIR", "models/embedding-int8")
+
+def get_pooling_mode(model_name: str) -> str:
+    """Read the sentence-transformers pooling mode so ONNX embeddings match the FP32 index"""
+    try:
+        from huggingface_hub import hf_hub_download
+        with open(hf_hub_download(model_name, "1_Pooling/config.json")) as f:
+            config = json.load(f)
+        if config.get("pooling_mode_cls_token"):
+            return "cls"
+    except Exception as e:
+        print(f"[WARNING] Could not read pooling config, defaulting to mean: {e}")
+    return "mean"
+
+def main():
+    model_name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_OUTPUT_DIR
+
+    print(f"[INFO] Exporting {model_name} to ONNX...")
+    with tempfile.TemporaryDirectory() as export_dir:
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(export_dir)
+
+        print("[INFO] Applying dynamic INT8 quantization (AVX2, per-channel)...")
+        quantizer = ORTQuantizer.from_pretrained(export_dir)
+        quantizer.quantize(
+            save_dir=output_dir,
+            quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=True)
+        )
+
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "pooling.json"), "w") as f:
+        json.dump({"pooling": get_pooling_mode(model_name)}, f)
+
+    print(f"[INFO] Quantized model saved to {output_dir}")
+    print(f"[INFO] Set EMBEDDING_ONNX_DIR={output_dir} to use it")
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,39 @@ Optimized server.py for Render's 512MB free tier
 - Implements memory-efficient initialization
 """
 
+import os
+
+# Pin native thread pools before torch/faiss are imported: batch-1 inference
+# on a fractional-vCPU dyno only loses to thread oversubscription
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
-import os
+from flask_compress import Compress
+import threading
 import time
-from datetime import datetime
 from config import Config
 from utils.logger import setup_logger
 from utils.cache import query_cache
 from utils.rate_limiter import rate_limiter
+from utils.json_provider import ORJSONProvider
+from utils.singleflight import query_flight
+from utils.stats import QueryStats
+from utils.api_helpers import (
+    INFLIGHT_TIMEOUT_SECONDS, health_timestamp, parse_query_request,
+    stream_query, get_store_stats, invalidate_store_stats
+)
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY
+app.json_provider_class = ORJSONProvider
+app.json = ORJSONProvider(app)
+
+# Brotli/gzip responses above COMPRESS_MIN_SIZE (settings in Config)
+Compress(app)
 
 # Setup CORS - Allow Netlify domain
 CORS(app, origins=['https://vcetai.netlify.app', 'http://localhost:3000'])
@@ -28,37 +47,60 @@ logger = setup_logger(__name__)
 
 # Global RAG search instance (lazy loaded)
 rag_search = None
-rag_stats = {
-    "total_queries": 0,
-    "cache_hits": 0,
-    "cache_misses": 0,
-    "average_response_time": 0,
-    "total_response_time": 0
-}
+rag_stats = QueryStats()
+
+_init_lock = threading.Lock()
+_init_done = threading.Event()
 
 def initialize_rag():
     """Lazy initialize RAG search system (only when needed)"""
     global rag_search
     
-    if rag_search is not None:
-        return True
-        
-    try:
-        logger.info("Initializing RAG search system...")
-        from src.search import RAGSearch
-        
-        rag_search = RAGSearch(
-            embedding_model=Config.EMBEDDING_MODEL,
-            llm_model=Config.LLM_MODEL
-        )
-        logger.info("RAG search system initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to initialize RAG system: {str(e)}")
-        return False
+    with _init_lock:
+        if rag_search is not None:
+            return True
+            
+        try:
+            logger.info("Initializing RAG search system...")
+            from src.search import RAGSearch
+            
+            rag_search = RAGSearch(
+                embedding_model=Config.EMBEDDING_MODEL,
+                llm_model=Config.LLM_MODEL
+            )
+            # /api/stats may have cached num_document_chunks=0 before the index loaded
+            invalidate_store_stats()
+            logger.info("RAG search system initialized successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to initialize RAG system: {str(e)}")
+            return False
+        finally:
+            # Wake waiting requests even on failure so they can retry or bail out
+            _init_done.set()
+
+def get_rag_search():
+    """Return (rag_search, error_response), lazily loading RAG on the first uncached query"""
+    if rag_search is None:
+        if Config.EAGER_WARM and not _init_done.wait(timeout=Config.RAG_INIT_TIMEOUT):
+            return None, (jsonify({
+                "status": "error",
+                "message": "RAG system is still warming up. Please try again shortly."
+            }), 503)
+        logger.info("First query received - initializing RAG system...")
+        if not initialize_rag():
+            return None, (jsonify({
+                "status": "error",
+                "message": "RAG system failed to initialize. Please try again later."
+            }), 503)
+    return rag_search, None
 
-# DO NOT initialize on startup - wait for first request
-# This prevents OOM on Render during boot
+# By default DO NOT initialize on startup - wait for first request
+# This prevents OOM on Render during boot. With EAGER_WARM=1 the model
+# loads in the background while the platform runs its health checks.
+if Config.EAGER_WARM:
+    logger.info("EAGER_WARM enabled - warming RAG system in background")
+    threading.Thread(target=initialize_rag, daemon=True).start()
 
 @app.route('/')
 def index():
@@ -71,7 +113,7 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "rag_initialized": rag_search is not None,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": health_timestamp(),
         "deployment": "render",
         "memory_optimized": True
     }), 200
@@ -79,86 +121,63 @@ def health_check():
 @app.route('/api/query', methods=['POST'])
 def query():
     """Main query endpoint for chatbot"""
-    global rag_search
-    
     try:
         # Get client ID for rate limiting
         client_id = request.remote_addr
         
-        # Check rate limit
-        if not rate_limiter.is_allowed(client_id):
+        # Check rate limit (one lookup also yields the remaining quota)
+        allowed, remaining_requests = rate_limiter.check(client_id)
+        if not allowed:
             return jsonify({
                 "status": "error",
                 "message": "Rate limit exceeded. Please try again later.",
                 "remaining_requests": 0
             }), 429
         
-        # Get query from request
-        data = request.get_json()
-        if not data or 'query' not in data:
-            return jsonify({
-                "status": "error",
-                "message": "Query parameter is required"
-            }), 400
-        
-        user_query = data.get('query', '').strip()
-        
-        # Validate query
-        if not user_query:
-            return jsonify({
-                "status": "error",
-                "message": "Query cannot be empty"
-            }), 400
-        
-        if len(user_query) > 1000:
-            return jsonify({
-                "status": "error",
-                "message": "Query is too long (max 1000 characters)"
-            }), 400
+        user_query, top_k, error = parse_query_request()
+        if error:
+            return error
         
         logger.info(f"Received query: {user_query[:100]}...")
         
         # Check cache FIRST (avoid loading model if cached)
-        cached_response = query_cache.get(user_query)
+        cache_key = query_cache.make_key(user_query)
+        cached_response = query_cache.get(cache_key)
         if cached_response:
             logger.info("Cache hit - returning cached response")
-            rag_stats["cache_hits"] += 1
-            rag_stats["total_queries"] += 1
+            rag_stats.add(cache_hits=1, total_queries=1)
             
             return jsonify({
                 "status": "success",
                 "response": cached_response["response"],
                 "sources": cached_response.get("sources", []),
                 "cached": True,
-                "remaining_requests": rate_limiter.get_remaining(client_id)
+                "remaining_requests": remaining_requests
             }), 200
         
-        rag_stats["cache_misses"] += 1
+        rag_stats.add(cache_misses=1)
         
         # Lazy load RAG on first real query (not cached)
-        if rag_search is None:
-            logger.info("First query received - initializing RAG system...")
-            if not initialize_rag():
-                return jsonify({
-                    "status": "error",
-                    "message": "RAG system failed to initialize. Please try again later."
-                }), 503
-        
-        # Get top_k from request or use default
-        top_k = data.get('top_k', Config.TOP_K_RESULTS)
+        rag, error = get_rag_search()
+        if error:
+            return error
         
         # Perform RAG search
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         try:
-            response = rag_search.search_and_summarize(user_query, top_k=top_k)
-            response_time = time.time() - start_time
+            # Identical questions already being answered wait for that result
+            response, shared = query_flight.do(
+                (cache_key, top_k),
+                lambda: rag.search_and_summarize(user_query, top_k=top_k),
+                timeout=INFLIGHT_TIMEOUT_SECONDS
+            )
+            if shared:
+                logger.info("Joined in-flight request for identical query")
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            response_time = elapsed_ns / 1e9
             
             # Update stats
-            rag_stats["total_queries"] += 1
-            rag_stats["total_response_time"] += response_time
-            rag_stats["average_response_time"] = (
-                rag_stats["total_response_time"] / rag_stats["total_queries"]
-            )
+            rag_stats.add(total_queries=1, total_response_ns=elapsed_ns)
             
             logger.info(f"Query processed in {response_time:.2f}s")
             
@@ -170,7 +189,7 @@ def query():
             }
             
             # Cache the response
-            query_cache.set(user_query, result)
+            query_cache.set(cache_key, result, original_query=user_query)
             
             return jsonify({
                 "status": "success",
@@ -178,7 +197,7 @@ def query():
                 "sources": result["sources"],
                 "response_time": result["response_time"],
                 "cached": False,
-                "remaining_requests": rate_limiter.get_remaining(client_id)
+                "remaining_requests": remaining_requests
             }), 200
             
         except Exception as e:
@@ -196,36 +215,37 @@ def query():
             "message": "An unexpected error occurred"
         }), 500
 
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """Streaming query endpoint - sends the answer as Server-Sent Events"""
+    return stream_query(get_rag_search, rag_stats, logger)
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get system statistics"""
     try:
-        faiss_path = os.path.join(Config.FAISS_STORE_DIR, "faiss.index")
-        meta_path = os.path.join(Config.FAISS_STORE_DIR, "metadata.pkl")
-        
-        # Get number of documents
-        num_chunks = 0
-        if rag_search and rag_search.vectorstore.index:
-            num_chunks = rag_search.vectorstore.index.ntotal
-        
         # Get cache stats
         cache_stats = query_cache.get_stats()
         
+        stats = rag_stats.snapshot()
+        total_queries = stats["total_queries"]
+        average_response_time = (
+            stats["total_response_ns"] / total_queries / 1e9
+            if total_queries > 0 else 0
+        )
+        
         return jsonify({
             "status": "success",
             "stats": {
-                "total_queries": rag_stats["total_queries"],
-                "cache_hits": rag_stats["cache_hits"],
-                "cache_misses": rag_stats["cache_misses"],
+                "total_queries": stats["total_queries"],
+                "cache_hits": stats["cache_hits"],
+                "cache_misses": stats["cache_misses"],
                 "cache_hit_rate": (
-                    round(rag_stats["cache_hits"] / rag_stats["total_queries"] * 100, 2)
-                    if rag_stats["total_queries"] > 0 else 0
+                    round(stats["cache_hits"] / stats["total_queries"] * 100, 2)
+                    if stats["total_queries"] > 0 else 0
                 ),
-                "average_response_time": round(rag_stats["average_response_time"], 2),
-                "vector_store_loaded": os.path.exists(faiss_path) and os.path.exists(meta_path),
-                "num_document_chunks": num_chunks,
-                "embedding_model": Config.EMBEDDING_MODEL,
-                "llm_model": Config.LLM_MODEL,
+                "average_response_time": round(average_response_time, 2),
+                **get_store_stats(rag_search),
                 "cache_size": cache_stats["size"],
                 "cache_max_size": cache_stats["max_size"],
                 "rag_loaded": rag_search is not None
@@ -1,18 +1,30 @@
 from flask import Flask, request, jsonify, render_template, session
 from flask_cors import CORS
+from flask_compress import Compress
 import os
 import time
-from datetime import datetime
 from config import Config
 from src.search import RAGSearch
 from utils.logger import setup_logger
 from utils.cache import query_cache
 from utils.rate_limiter import rate_limiter
+from utils.json_provider import ORJSONProvider
+from utils.singleflight import query_flight
+from utils.stats import QueryStats
+from utils.api_helpers import (
+    INFLIGHT_TIMEOUT_SECONDS, health_timestamp, parse_query_request,
+    stream_query, get_store_stats, invalidate_store_stats
+)
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY
+app.json_provider_class = ORJSONProvider
+app.json = ORJSONProvider(app)
+
+# Brotli/gzip responses above COMPRESS_MIN_SIZE (settings in Config)
+Compress(app)
 
 # Setup CORS
 CORS(app, origins=Config.CORS_ORIGINS)
@@ -22,29 +34,36 @@ logger = setup_logger(__name__)
 
 # Global RAG search instance
 rag_search = None
-rag_stats = {
-    "total_queries": 0,
-    "cache_hits": 0,
-    "cache_misses": 0,
-    "average_response_time": 0,
-    "total_response_time": 0
-}
+rag_stats = QueryStats()
 
 def initialize_rag():
     """Initialize RAG search system"""
     global rag_search
     try:
         logger.info("Initializing RAG search system...")
+        previous = rag_search
         rag_search = RAGSearch(
             embedding_model=Config.EMBEDDING_MODEL,
             llm_model=Config.LLM_MODEL
         )
+        # A rebuild replaces the instance; stop the old one's worker so it can be freed
+        if previous is not None:
+            previous.close()
         logger.info("RAG search system initialized successfully")
         return True
     except Exception as e:
         logger.error(f"Failed to initialize RAG system: {str(e)}")
         return False
 
+def get_rag_search():
+    """Return (rag_search, error_response) for query handlers"""
+    if rag_search is None:
+        return None, (jsonify({
+            "status": "error",
+            "message": "RAG system is not initialized. Please try again later."
+        }), 503)
+    return rag_search, None
+
 # Initialize on startup
 with app.app_context():
     initialize_rag()
@@ -60,7 +79,7 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "rag_initialized": rag_search is not None,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": health_timestamp()
     }), 200
 
 @app.route('/api/query', methods=['POST'])
@@ -70,78 +89,59 @@ def query():
         # Get client ID for rate limiting
         client_id = request.remote_addr
         
-        # Check rate limit
-        if not rate_limiter.is_allowed(client_id):
+        # Check rate limit (one lookup also yields the remaining quota)
+        allowed, remaining_requests = rate_limiter.check(client_id)
+        if not allowed:
             return jsonify({
                 "status": "error",
                 "message": "Rate limit exceeded. Please try again later.",
                 "remaining_requests": 0
             }), 429
         
-        # Get query from request
-        data = request.get_json()
-        if not data or 'query' not in data:
-            return jsonify({
-                "status": "error",
-                "message": "Query parameter is required"
-            }), 400
-        
-        user_query = data.get('query', '').strip()
-        
-        # Validate query
-        if not user_query:
-            return jsonify({
-                "status": "error",
-                "message": "Query cannot be empty"
-            }), 400
-        
-        if len(user_query) > 1000:
-            return jsonify({
-                "status": "error",
-                "message": "Query is too long (max 1000 characters)"
-            }), 400
+        user_query, top_k, error = parse_query_request()
+        if error:
+            return error
         
         logger.info(f"Received query: {user_query[:100]}...")
         
         # Check cache
-        cached_response = query_cache.get(user_query)
+        cache_key = query_cache.make_key(user_query)
+        cached_response = query_cache.get(cache_key)
         if cached_response:
             logger.info("Cache hit - returning cached response")
-            rag_stats["cache_hits"] += 1
-            rag_stats["total_queries"] += 1
+            rag_stats.add(cache_hits=1, total_queries=1)
             
             return jsonify({
                 "status": "success",
                 "response": cached_response["response"],
                 "sources": cached_response.get("sources", []),
                 "cached": True,
-                "remaining_requests": rate_limiter.get_remaining(client_id)
+                "remaining_requests": remaining_requests
             }), 200
         
-        rag_stats["cache_misses"] += 1
+        rag_stats.add(cache_misses=1)
         
         # Check if RAG is initialized
-        if rag_search is None:
-            return jsonify({
-                "status": "error",
-                "message": "RAG system is not initialized. Please try again later."
-            }), 503
-        
-        # Get top_k from request or use default
-        top_k = data.get('top_k', Config.TOP_K_RESULTS)
+        rag, error = get_rag_search()
+        if error:
+            return error
         
         # Perform RAG search
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         try:
-            response = rag_search.search_and_summarize(user_query, top_k=top_k)
-            response_time = time.time() - start_time
+            # Identical questions already being answered wait for that result
+            response, shared = query_flight.do(
+                (cache_key, top_k),
+                lambda: rag.search_and_summarize(user_query, top_k=top_k),
+                timeout=INFLIGHT_TIMEOUT_SECONDS
+            )
+            if shared:
+                logger.info("Joined in-flight request for identical query")
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            response_time = elapsed_ns / 1e9
             
             # Update stats
-            rag_stats["total_queries"] += 1
-            rag_stats["total_response_time"] += response_time
-            rag_stats["average_response_time"] = (
-                rag_stats["total_response_time"] / rag_stats["total_queries"]
-            )
+            rag_stats.add(total_queries=1, total_response_ns=elapsed_ns)
             
             logger.info(f"Query processed in {response_time:.2f}s")
             
@@ -153,7 +153,7 @@ def query():
             }
             
             # Cache the response
-            query_cache.set(user_query, result)
+            query_cache.set(cache_key, result, original_query=user_query)
             
             return jsonify({
                 "status": "success",
@@ -161,7 +161,7 @@ def query():
                 "sources": result["sources"],
                 "response_time": result["response_time"],
                 "cached": False,
-                "remaining_requests": rate_limiter.get_remaining(client_id)
+                "remaining_requests": remaining_requests
             }), 200
             
         except Exception as e:
@@ -179,36 +179,37 @@ def query():
             "message": "An unexpected error occurred"
         }), 500
 
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """Streaming query endpoint - sends the answer as Server-Sent Events"""
+    return stream_query(get_rag_search, rag_stats, logger)
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get system statistics"""
     try:
-        faiss_path = os.path.join(Config.FAISS_STORE_DIR, "faiss.index")
-        meta_path = os.path.join(Config.FAISS_STORE_DIR, "metadata.pkl")
-        
-        # Get number of documents
-        num_chunks = 0
-        if rag_search and rag_search.vectorstore.index:
-            num_chunks = rag_search.vectorstore.index.ntotal
-        
         # Get cache stats
         cache_stats = query_cache.get_stats()
         
+        stats = rag_stats.snapshot()
+        total_queries = stats["total_queries"]
+        average_response_time = (
+            stats["total_response_ns"] / total_queries / 1e9
+            if total_queries > 0 else 0
+        )
+        
         return jsonify({
             "status": "success",
             "stats": {
-                "total_queries": rag_stats["total_queries"],
-                "cache_hits": rag_stats["cache_hits"],
-                "cache_misses": rag_stats["cache_misses"],
+                "total_queries": stats["total_queries"],
+                "cache_hits": stats["cache_hits"],
+                "cache_misses": stats["cache_misses"],
                 "cache_hit_rate": (
-                    round(rag_stats["cache_hits"] / rag_stats["total_queries"] * 100, 2)
-                    if rag_stats["total_queries"] > 0 else 0
+                    round(stats["cache_hits"] / stats["total_queries"] * 100, 2)
+                    if stats["total_queries"] > 0 else 0
                 ),
-                "average_response_time": round(rag_stats["average_response_time"], 2),
-                "vector_store_loaded": os.path.exists(faiss_path) and os.path.exists(meta_path),
-                "num_document_chunks": num_chunks,
-                "embedding_model": Config.EMBEDDING_MODEL,
-                "llm_model": Config.LLM_MODEL,
+                "average_response_time": round(average_response_time, 2),
+                **get_store_stats(rag_search),
                 "cache_size": cache_stats["size"],
                 "cache_max_size": cache_stats["max_size"]
             }
@@ -267,6 +268,7 @@ def rebuild_index():
         
         # Reinitialize RAG
         initialize_rag()
+        invalidate_store_stats()
         
         # Clear cache
         query_cache.clear()
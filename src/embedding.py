@@ -1,14 +1,91 @@
+import os
+import json
 from typing import List, Any
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from config import Config
 from src.data_loader import load_all_documents
 
+class OnnxEmbeddingModel:
+    """INT8-quantized ONNX Runtime encoder with a SentenceTransformer-style encode()"""
+
+    def __init__(self, model_dir: str, file_name: str = "model_quantized.onnx", num_threads: int = 1):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        # ONNX Runtime sizes its own pools (one thread per core by default), so pin them like torch's
+        self.num_threads = num_threads
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        session_options.inter_op_num_threads = num_threads
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=file_name, provider="CPUExecutionProvider", session_options=session_options
+        )
+        # Pooling mode is recorded by scripts/quantize_embedding_model.py
+        self.pooling = "mean"
+        pooling_path = os.path.join(model_dir, "pooling.json")
+        if os.path.exists(pooling_path):
+            with open(pooling_path) as f:
+                self.pooling = json.load(f).get("pooling", "mean")
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = inputs["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            batches.append(pooled / np.clip(norms, 1e-12, None))
+        return np.vstack(batches).astype(np.float32)
+
+def load_embedding_model(model_name: str):
+    """Load the quantized ONNX encoder when EMBEDDING_ONNX_DIR is set, else the FP32 SentenceTransformer"""
+    onnx_dir = Config.EMBEDDING_ONNX_DIR
+    if onnx_dir:
+        if os.path.isdir(onnx_dir):
+            print(f"[INFO] Using INT8 ONNX embedding model from {onnx_dir}")
+            return OnnxEmbeddingModel(onnx_dir, num_threads=Config.TORCH_THREADS)
+        print(f"[WARNING] EMBEDDING_ONNX_DIR={onnx_dir} not found, falling back to FP32 {model_name}")
+    # Imported lazily; optimum imports torch too, so the ONNX path still loads it
+    # (only the encoder itself runs in ONNX Runtime)
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    if Config.TORCH_COMPILE:
+        compile_embedding_model(model)
+    return model
+
+def compile_embedding_model(model) -> None:
+    """Compile the transformer with torch.compile/inductor and warm it up before first use"""
+    import torch
+    transformer = model[0].auto_model
+    try:
+        # dynamic=True avoids recompiling for every new query length
+        model[0].auto_model = torch.compile(transformer, mode="reduce-overhead", backend="inductor", dynamic=True)
+        model.encode(["warm-up query"])
+        print("[INFO] Embedding model compiled with torch.compile")
+    except Exception as e:
+        model[0].auto_model = transformer
+        print(f"[WARNING] torch.compile failed, using eager embedding model: {e}")
+
 class EmbeddingPipeline:
     def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.model = SentenceTransformer(model_name)
+        self.model = load_embedding_model(model_name)
         print(f"[INFO] Loaded embedding model: {model_name}")
 
     def chunk_documents(self, documents: List[Any]) -> List[Any]:
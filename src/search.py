@@ -1,22 +1,81 @@
 import os
-from dotenv import load_dotenv
+import socket
+import sys
+from collections import OrderedDict
+import faiss
+import httpx
+import numpy as np
+from config import Config
 from src.vectorstore import FaissVectorStore
+from utils.batcher import MicroBatcher
 from langchain_groq import ChatGroq
 
-load_dotenv()
+# Retrieved context sent to the LLM is capped; prefill latency scales with input tokens
+MAX_CONTEXT_TOKENS = Config.MAX_CONTEXT_TOKENS
+MAX_CONTEXT_CHARS = MAX_CONTEXT_TOKENS * 6
+
+# Embeddings kept for repeated queries (LRU, owned by the batcher thread)
+QUERY_VECTOR_CACHE_SIZE = 1024
+
+# Max time a request waits for its batched embedding + Faiss search
+RETRIEVAL_TIMEOUT_SECONDS = 30
+
+# Queries shorter than this (after normalization) carry nothing to retrieve on
+MIN_QUERY_CHARS = 3
+VAGUE_QUERY_RESPONSE = (
+    "Could you be a bit more specific? For example, ask about admissions, "
+    "courses, placements or facilities at VCET."
+)
+
+_GREETING_REPLY = (
+    "Hello! I'm the VCET AI assistant. Ask me about admissions, courses, "
+    "placements, facilities or anything else about the college."
+)
+_THANKS_REPLY = "You're welcome! Let me know if you have any other questions about VCET."
+_ACK_REPLY = "Glad I could help! Is there anything else you'd like to know about VCET?"
+_BYE_REPLY = "Goodbye! Come back any time you have questions about VCET."
+_HOW_ARE_YOU_REPLY = "I'm doing well, thanks for asking! What would you like to know about VCET?"
+_SMALL_TALK = {
+    _GREETING_REPLY: [
+        "hi", "hii", "hello", "hey", "hey there", "hi there", "hello there", "yo",
+        "howdy", "greetings", "namaste", "vanakkam", "good morning",
+        "good afternoon", "good evening", "who are you", "what can you do"
+    ],
+    _THANKS_REPLY: ["thanks", "thank you", "thank you so much", "thanks a lot", "thx", "ty"],
+    _ACK_REPLY: ["ok", "okay", "cool", "great", "nice", "awesome"],
+    _BYE_REPLY: ["bye", "goodbye", "bye bye", "see you", "good night"],
+    _HOW_ARE_YOU_REPLY: ["how are you", "how are you doing"],
+}
 
 class RAGSearch:
     def __init__(self, persist_dir: str = "faiss_store", embedding_model: str = "all-MiniLM-L6-v2", llm_model: str = "gemma2-9b-it"):
+        faiss_threads = Config.FAISS_THREADS
+        faiss.omp_set_num_threads(faiss_threads)
         self.vectorstore = FaissVectorStore(persist_dir, embedding_model)
+        # Both encoder backends import torch (optimum does so at module level)
+        torch_threads = None
+        if "torch" in sys.modules:
+            import torch
+            torch_threads = Config.TORCH_THREADS
+            torch.set_num_threads(torch_threads)
+        # Set only when the INT8 ONNX encoder is in use
+        onnx_threads = getattr(self.vectorstore.model, "num_threads", None)
+        print(f"[INFO] Inference threads: faiss={faiss_threads}, torch={torch_threads}, onnxruntime={onnx_threads}")
+        # Concurrent queries are embedded and searched together; repeated
+        # questions reuse their cached embedding and skip the encoder
+        self._query_vectors = OrderedDict()
+        self._batcher = MicroBatcher(self._retrieve_batch, max_batch_size=32, max_wait=0.005)
         
         # Check if faiss_store exists
-        faiss_path = os.path.join(persist_dir, "faiss.index")
-        meta_path = os.path.join(persist_dir, "metadata.pkl")
-        
-        if os.path.exists(faiss_path) and os.path.exists(meta_path):
+        if self.vectorstore.exists():
             # Load existing vector store
             print(f"[INFO] Loading existing vector store from {persist_dir}")
             self.vectorstore.load()
+            if Config.WARM_FAISS:
+                try:
+                    self.vectorstore.warm()
+                except Exception as e:
+                    print(f"[WARNING] Faiss warm-up failed: {e}")
         else:
             # Build new vector store only if documents are available
             print(f"[INFO] No existing vector store found. Building new one...")
@@ -32,22 +91,161 @@ class RAGSearch:
             self.vectorstore.build_from_documents(docs)
         
         # Initialize Groq LLM
-        groq_api_key = os.getenv("GROQ_API_KEY")
+        groq_api_key = Config.GROQ_API_KEY
         if not groq_api_key:
             raise ValueError("GROQ_API_KEY environment variable is not set")
-        self.llm = ChatGroq(groq_api_key=groq_api_key, model_name=llm_model)
+        # One pooled HTTP/2 keep-alive client so LLM calls skip repeated TLS handshakes
+        self.http_client = httpx.Client(
+            transport=httpx.HTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+                socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+            ),
+            timeout=httpx.Timeout(30.0, connect=5.0)
+        )
+        self.llm = ChatGroq(groq_api_key=groq_api_key, model_name=llm_model, http_client=self.http_client)
         print(f"[INFO] Groq LLM initialized: {llm_model}")
+        
+        # Canned replies for small talk, so it never reaches Faiss or the LLM
+        self._greeting_responses = {
+            phrase: reply for reply, phrases in _SMALL_TALK.items() for phrase in phrases
+        }
+        
+        # Static prompt fragments, built once and joined around each query/context
+        self._prompt_prefix = "Summarize the following context for the query: '"
+        self._prompt_middle = "'\n\nContext:\n"
+        self._prompt_suffix = "\n\nSummary:"
+        
+        # Token counter for the context budget; falls back to ~4 chars per token
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"[WARNING] tiktoken unavailable, estimating tokens from length: {e}")
+            self._encoding = None
 
-    def search_and_summarize(self, query: str, top_k: int = 5) -> str:
-        results = self.vectorstore.query(query, top_k=top_k)
-        texts = [r["metadata"].get("text", "") for r in results if r["metadata"]]
-        context = "\n\n".join(texts)
+    def close(self):
+        """Stop the retrieval worker thread; call before replacing this instance"""
+        self._batcher.close()
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _retrieve_batch(self, requests):
+        """Resolve a batch of (normalized query, top_k) requests; a failed request gets its exception back"""
+        results = [None] * len(requests)
+        pending = []
+        for i, (_, top_k) in enumerate(requests):
+            if isinstance(top_k, int) and not isinstance(top_k, bool) and top_k > 0:
+                pending.append(i)
+            else:
+                results[i] = ValueError(f"top_k must be a positive integer, got {top_k!r}")
+        if not pending:
+            return results
+        try:
+            searched = self._search_requests([requests[i] for i in pending])
+        except Exception:
+            # Retry one by one so a single bad request can't fail everyone it was batched with
+            searched = []
+            for i in pending:
+                try:
+                    searched.extend(self._search_requests([requests[i]]))
+                except Exception as e:
+                    searched.append(e)
+        for i, result in zip(pending, searched):
+            results[i] = result
+        return results
+
+    def _search_requests(self, requests):
+        """Embed and search (normalized query, top_k) requests together"""
+        missing = []
+        for norm_q, _ in requests:
+            if norm_q in self._query_vectors:
+                self._query_vectors.move_to_end(norm_q)
+            elif norm_q not in missing:
+                missing.append(norm_q)
+        
+        # One encoder forward pass for every uncached query in the batch
+        if missing:
+            for norm_q, vector in zip(missing, self.vectorstore.embed_queries(missing)):
+                self._query_vectors[norm_q] = vector
+                if len(self._query_vectors) > QUERY_VECTOR_CACHE_SIZE:
+                    self._query_vectors.popitem(last=False)
+        
+        vectors = np.stack([self._query_vectors[norm_q] for norm_q, _ in requests])
+        max_k = max(top_k for _, top_k in requests)
+        batch_results = self.vectorstore.search_batch(vectors, top_k=max_k)
+        return [results[:top_k] for results, (_, top_k) in zip(batch_results, requests)]
+
+    def _count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) // 4
+
+    def _build_context(self, results) -> str:
+        """Join retrieved chunks until the token budget is spent, skipping near-duplicates"""
+        texts = []
+        seen = set()
+        used_tokens = 0
+        for r in results:
+            text = r["metadata"].get("text", "") if r["metadata"] else ""
+            if not text:
+                continue
+            fingerprint = hash(" ".join(text[:128].lower().split()))
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            tokens = self._count_tokens(text)
+            if texts and used_tokens + tokens > MAX_CONTEXT_TOKENS:
+                break
+            texts.append(text)
+            used_tokens += tokens
+        return "\n\n".join(texts)[:MAX_CONTEXT_CHARS]
+
+    def _build_prompt(self, query: str, top_k: int):
+        """Retrieve context for the query; returns None when nothing relevant is found"""
+        print(f"[INFO] Querying vector store for: '{query}'")
+        future = self._batcher.submit((self._normalize_query(query), top_k))
+        results = future.result(timeout=RETRIEVAL_TIMEOUT_SECONDS)
+        context = self._build_context(results)
         if not context:
+            return None
+        return "".join((self._prompt_prefix, query, self._prompt_middle, context, self._prompt_suffix))
+
+    def _canned_response(self, query: str):
+        """Reply for greetings and too-short queries; None when retrieval is needed"""
+        norm_q = self._normalize_query(query).strip(" !?.,")
+        if norm_q in self._greeting_responses:
+            return self._greeting_responses[norm_q]
+        if len(norm_q) < MIN_QUERY_CHARS:
+            return VAGUE_QUERY_RESPONSE
+        return None
+
+    def search_and_summarize(self, query: str, top_k: int = 5) -> str:
+        canned = self._canned_response(query)
+        if canned is not None:
+            return canned
+        prompt = self._build_prompt(query, top_k)
+        if prompt is None:
             return "No relevant documents found."
-        prompt = f"""Summarize the following context for the query: '{query}'\n\nContext:\n{context}\n\nSummary:"""
         response = self.llm.invoke([prompt])
         return response.content
 
+    def search_and_stream(self, query: str, top_k: int = 5):
+        """Yield the summary in chunks as the LLM generates it"""
+        canned = self._canned_response(query)
+        if canned is not None:
+            yield canned
+            return
+        prompt = self._build_prompt(query, top_k)
+        if prompt is None:
+            yield "No relevant documents found."
+            return
+        for chunk in self.llm.stream([prompt]):
+            if chunk.content:
+                yield chunk.content
+
 # Example usage
 if __name__ == "__main__":
     rag_search = RAGSearch()
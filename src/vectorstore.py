@@ -3,8 +3,38 @@ import faiss
 import numpy as np
 import pickle
 from typing import List, Any
-from sentence_transformers import SentenceTransformer
-from src.embedding import EmbeddingPipeline
+from config import Config
+from src.embedding import EmbeddingPipeline, load_embedding_model
+
+# Version 2: vectors are L2-normalized and searched by inner product (cosine)
+METADATA_VERSION = 2
+
+# Chunk texts live in one UTF-8 blob plus an int64 offsets array, both memory-mapped
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.npz"
+LEGACY_META_FILE = "metadata.pkl"
+
+class ChunkTextStore:
+    """Read-only, memory-mapped chunk metadata; decodes a chunk only when it is indexed"""
+
+    def __init__(self, texts_path: str, offsets_path: str):
+        self.offsets = np.load(offsets_path, mmap_mode='r')
+        if os.path.getsize(texts_path) > 0:
+            self.texts = np.memmap(texts_path, dtype=np.uint8, mode='r')
+        else:
+            self.texts = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> dict:
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return {"text": self.texts[start:end].tobytes().decode("utf-8")}
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
 
 class FaissVectorStore:
     def __init__(self, persist_dir: str = "faiss_store", embedding_model: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
@@ -13,7 +43,7 @@ class FaissVectorStore:
         self.index = None
         self.metadata = []
         self.embedding_model = embedding_model
-        self.model = SentenceTransformer(embedding_model)
+        self.model = load_embedding_model(embedding_model)
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         print(f"[INFO] Loaded embedding model: {embedding_model}")
@@ -28,46 +58,196 @@ class FaissVectorStore:
         self.save()
         print(f"[INFO] Vector store built and saved to {self.persist_dir}")
 
-    def add_embeddings(self, embeddings: np.ndarray, metadatas: List[Any] = None):
+    def add_embeddings(self, embeddings: np.ndarray, metadatas: List[Any] = None, index_type: str = None):
         if embeddings.size == 0:
             print("[WARNING] No embeddings to add. Skipping...")
             return
         
+        # Unit vectors turn cosine similarity into a single inner product per query
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        faiss.normalize_L2(embeddings)
         dim = embeddings.shape[1]
         if self.index is None:
-            self.index = faiss.IndexFlatL2(dim)
+            self.index = self._create_index(dim, embeddings.shape[0], index_type)
+            self._configure_search()
+        if not self.index.is_trained:
+            print(f"[INFO] Training Faiss index on {embeddings.shape[0]} vectors...")
+            self.index.train(embeddings)
         self.index.add(embeddings)
         if metadatas:
+            if not isinstance(self.metadata, list):
+                self.metadata = list(self.metadata)
             self.metadata.extend(metadatas)
         print(f"[INFO] Added {embeddings.shape[0]} vectors to Faiss index.")
 
+    def _create_index(self, dim: int, num_vectors: int, index_type: str = None):
+        """Pick an index for the corpus size; FAISS_INDEX_TYPE (flat, hnsw, ivfpq) overrides"""
+        index_type = (index_type or Config.FAISS_INDEX_TYPE).lower()
+        if index_type == "auto":
+            if num_vectors < 1000:
+                index_type = "flat"
+            elif num_vectors < 200000:
+                index_type = "hnsw"
+            else:
+                index_type = "ivfpq"
+
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+        elif index_type == "ivfpq":
+            nlist = max(1, int(np.sqrt(num_vectors)))
+            m = next(m for m in (32, 16, 8, 4, 2, 1) if dim % m == 0)
+            index = faiss.index_factory(dim, f"OPQ{m},IVF{nlist},PQ{m}", faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexFlatIP(dim)
+        print(f"[INFO] Created {index_type} Faiss index (dim={dim}, vectors={num_vectors})")
+        return index
+
+    def _configure_search(self):
+        """Apply query-time recall/speed knobs for approximate indexes"""
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = Config.FAISS_EF_SEARCH
+            return
+        try:
+            faiss.extract_index_ivf(self.index).nprobe = Config.FAISS_NPROBE
+        except RuntimeError:
+            pass  # Flat index: exact search, nothing to tune
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def exists(self) -> bool:
+        """True if an index plus chunk metadata (current or legacy pickle) is on disk"""
+        has_meta = os.path.exists(self._path(OFFSETS_FILE)) or os.path.exists(self._path(LEGACY_META_FILE))
+        return os.path.exists(self._path("faiss.index")) and has_meta
+
     def save(self):
-        faiss_path = os.path.join(self.persist_dir, "faiss.index")
-        meta_path = os.path.join(self.persist_dir, "metadata.pkl")
-        faiss.write_index(self.index, faiss_path)
-        with open(meta_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        faiss.write_index(self.index, self._path("faiss.index"))
+        encoded = [(meta or {}).get("text", "").encode("utf-8") for meta in self.metadata]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        # Write to temp files and swap in, so live memory maps of the old files stay valid
+        with open(self._path(TEXTS_FILE + ".tmp"), "wb") as f:
+            f.writelines(encoded)
+        with open(self._path(OFFSETS_FILE + ".tmp"), "wb") as f:
+            np.save(f, offsets)
+        with open(self._path(META_FILE + ".tmp"), "wb") as f:
+            np.savez(f, version=METADATA_VERSION)
+        for name in (TEXTS_FILE, OFFSETS_FILE, META_FILE):
+            os.replace(self._path(name + ".tmp"), self._path(name))
         print(f"[INFO] Saved Faiss index and metadata to {self.persist_dir}")
 
     def load(self):
-        faiss_path = os.path.join(self.persist_dir, "faiss.index")
-        meta_path = os.path.join(self.persist_dir, "metadata.pkl")
-        self.index = faiss.read_index(faiss_path)
-        with open(meta_path, "rb") as f:
-            self.metadata = pickle.load(f)
+        self.index = faiss.read_index(self._path("faiss.index"))
+        self._configure_search()
+        if os.path.exists(self._path(OFFSETS_FILE)):
+            with np.load(self._path(META_FILE)) as meta:
+                version = int(meta["version"])
+            self.metadata = ChunkTextStore(self._path(TEXTS_FILE), self._path(OFFSETS_FILE))
+            if version != METADATA_VERSION:
+                self._migrate_legacy_index()
+        else:
+            # Pickled stores are converted to the memory-mapped layout once
+            with open(self._path(LEGACY_META_FILE), "rb") as f:
+                stored = pickle.load(f)
+            # The oldest stores pickled a bare list alongside an un-normalized L2 index
+            if isinstance(stored, dict) and stored.get("version") == METADATA_VERSION:
+                self.metadata = stored["metadata"]
+                self.save()
+            else:
+                self.metadata = stored["metadata"] if isinstance(stored, dict) else stored
+                self._migrate_legacy_index()
+            self.metadata = ChunkTextStore(self._path(TEXTS_FILE), self._path(OFFSETS_FILE))
         print(f"[INFO] Loaded Faiss index and metadata from {self.persist_dir}")
 
+    def _migrate_legacy_index(self):
+        """Rebuild a pre-version-2 L2 index as a normalized inner-product index of the same kind, once"""
+        print("[INFO] Migrating legacy Faiss index to normalized inner-product search...")
+        # Keep the kind of index that was shipped: an exact flat store must not turn approximate
+        if hasattr(self.index, "hnsw"):
+            index_type = "hnsw"
+        else:
+            try:
+                faiss.extract_index_ivf(self.index).make_direct_map()
+                index_type = "ivfpq"
+            except RuntimeError:
+                index_type = "flat"
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        metadata = list(self.metadata)
+        self.index = None
+        self.metadata = []
+        self.add_embeddings(vectors, metadata, index_type=index_type)
+        self.save()
+
+    @staticmethod
+    def _touch(ptr, size: int) -> int:
+        """Read a native Faiss buffer end to end without copying it; returns bytes read"""
+        if size == 0:
+            return 0
+        view = faiss.rev_swig_ptr(ptr, size)
+        view.sum(dtype=np.uint64)
+        return view.nbytes
+
+    def warm(self):
+        """Read the index's vectors/codes once so the first real query doesn't pay cold-page costs"""
+        if self.index is None or self.index.ntotal == 0:
+            return
+        touched = 0
+        try:
+            ivf = faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            ivf = None
+        if ivf is not None:
+            # Every inverted list's codes
+            invlists = ivf.invlists
+            for list_no in range(ivf.nlist):
+                size = invlists.list_size(list_no)
+                if size:
+                    codes = invlists.get_codes(list_no)
+                    touched += self._touch(codes, size * invlists.code_size)
+                    invlists.release_codes(list_no, codes)
+        else:
+            index = self.index
+            if hasattr(index, "hnsw"):
+                # HNSW: the neighbor graph plus the flat storage holding the vectors
+                neighbors = index.hnsw.neighbors
+                touched += self._touch(neighbors.data(), neighbors.size())
+                index = faiss.downcast_index(index.storage)
+            if hasattr(index, "codes"):
+                touched += self._touch(index.codes.data(), index.codes.size())
+        # One search also initializes the query path (coarse quantizer, OPQ transform)
+        self.index.search(np.zeros((1, self.index.d), dtype='float32'), 1)
+        print(f"[INFO] Warmed Faiss index ({self.index.ntotal} vectors, {touched / 2**20:.1f} MiB read)")
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5) -> List[List[dict]]:
+        """Search several query vectors in one Faiss call; one result list per row"""
+        D, I = self.index.search(query_embeddings, top_k)
+        batch_results = []
+        for ids, dists in zip(I, D):
+            results = []
+            for idx, dist in zip(ids, dists):
+                # Approximate indexes pad with -1 when fewer than top_k hits are found
+                meta = self.metadata[idx] if 0 <= idx < len(self.metadata) else None
+                # With the inner-product index "distance" is cosine similarity (higher is closer)
+                results.append({"index": idx, "distance": dist, "metadata": meta})
+            batch_results.append(results)
+        return batch_results
+
     def search(self, query_embedding: np.ndarray, top_k: int = 5):
-        D, I = self.index.search(query_embedding, top_k)
-        results = []
-        for idx, dist in zip(I[0], D[0]):
-            meta = self.metadata[idx] if idx < len(self.metadata) else None
-            results.append({"index": idx, "distance": dist, "metadata": meta})
-        return results
-
-    def query(self, query_text: str, top_k: int = 5):
+        return self.search_batch(query_embedding, top_k=top_k)[0]
+
+    def embed_queries(self, query_texts: List[str]) -> np.ndarray:
+        query_embs = np.ascontiguousarray(self.model.encode(query_texts), dtype='float32')
+        faiss.normalize_L2(query_embs)
+        return query_embs
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        return self.embed_queries([query_text])
+
+    def query(self, query_text: str, top_k: int = 5, query_vec: np.ndarray = None):
         print(f"[INFO] Querying vector store for: '{query_text}'")
-        query_emb = self.model.encode([query_text]).astype('float32')
+        # Callers that already hold the embedding (e.g. from a cache) skip the encode
+        query_emb = query_vec if query_vec is not None else self.embed_query(query_text)
         return self.search(query_emb, top_k=top_k)
 
 # Example usage
@@ -0,0 +1,191 @@
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+from flask import request, jsonify, current_app, Response, stream_with_context
+from config import Config
+from utils.cache import query_cache
+from utils.rate_limiter import rate_limiter
+from utils.stats import QueryStats
+
+# Shared by server.py and server-optimized.py
+
+# Max time a duplicate query waits on the identical in-flight request before
+# running its own; together with that run it stays under gunicorn's 120 s timeout
+INFLIGHT_TIMEOUT_SECONDS = 30
+
+# Upper bound for a request's top_k
+MAX_TOP_K = 20
+
+# Keep proxies from buffering or caching Server-Sent Events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@lru_cache(maxsize=1)
+def _timestamp_for_second(second: int) -> str:
+    return datetime.fromtimestamp(second).isoformat()
+
+def health_timestamp() -> str:
+    """ISO timestamp formatted at most once per second"""
+    return _timestamp_for_second(int(time.time()))
+
+def parse_query_request():
+    """Validate a query request body; returns (user_query, top_k, error_response)"""
+    data = request.get_json()
+    if not data or 'query' not in data:
+        return None, None, (jsonify({
+            "status": "error",
+            "message": "Query parameter is required"
+        }), 400)
+    
+    user_query = data.get('query', '').strip()
+    
+    # Validate query
+    if not user_query:
+        return None, None, (jsonify({
+            "status": "error",
+            "message": "Query cannot be empty"
+        }), 400)
+    
+    if len(user_query) > 1000:
+        return None, None, (jsonify({
+            "status": "error",
+            "message": "Query is too long (max 1000 characters)"
+        }), 400)
+    
+    # top_k sizes a Faiss search shared with other requests' batch, so it must be a sane int
+    top_k = data.get('top_k', Config.TOP_K_RESULTS)
+    if not isinstance(top_k, int) or isinstance(top_k, bool):
+        return None, None, (jsonify({
+            "status": "error",
+            "message": f"top_k must be an integer (1-{MAX_TOP_K})"
+        }), 400)
+    top_k = min(max(top_k, 1), MAX_TOP_K)
+    
+    return user_query, top_k, None
+
+def sse_event(payload: dict) -> str:
+    """Format a payload as a Server-Sent Events data frame"""
+    return f"data: {current_app.json.dumps(payload)}\n\n"
+
+def stream_query(get_rag, rag_stats: QueryStats, logger):
+    """Handle /api/query/stream; get_rag() returns (rag_search, error_response)"""
+    try:
+        client_id = request.remote_addr
+        
+        # Check rate limit (one lookup also yields the remaining quota)
+        allowed, remaining_requests = rate_limiter.check(client_id)
+        if not allowed:
+            return jsonify({
+                "status": "error",
+                "message": "Rate limit exceeded. Please try again later.",
+                "remaining_requests": 0
+            }), 429
+        
+        user_query, top_k, error = parse_query_request()
+        if error:
+            return error
+        
+        logger.info(f"Received streaming query: {user_query[:100]}...")
+        
+        # Check cache - replay the stored answer as a single event
+        cache_key = query_cache.make_key(user_query)
+        cached_response = query_cache.get(cache_key)
+        if cached_response:
+            logger.info("Cache hit - replaying cached response")
+            rag_stats.add(cache_hits=1, total_queries=1)
+            
+            def replay():
+                yield sse_event({"token": cached_response["response"]})
+                yield sse_event({
+                    "done": True,
+                    "sources": cached_response.get("sources", []),
+                    "cached": True,
+                    "remaining_requests": remaining_requests
+                })
+            
+            return Response(stream_with_context(replay()), mimetype='text/event-stream', headers=SSE_HEADERS)
+        
+        rag_stats.add(cache_misses=1)
+        
+        # Check if RAG is initialized
+        rag_search, error = get_rag()
+        if error:
+            return error
+        
+        def generate():
+            start_ns = time.perf_counter_ns()
+            parts = []
+            try:
+                for token in rag_search.search_and_stream(user_query, top_k=top_k):
+                    parts.append(token)
+                    yield sse_event({"token": token})
+            except Exception as e:
+                logger.error(f"Error streaming query: {str(e)}")
+                yield sse_event({
+                    "error": "Failed to process query. Please try again.",
+                    "detail": str(e) if Config.DEBUG else None
+                })
+                return
+            
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            response_time = elapsed_ns / 1e9
+            rag_stats.add(total_queries=1, total_response_ns=elapsed_ns)
+            logger.info(f"Streamed query processed in {response_time:.2f}s")
+            
+            # Cache the full answer once the stream completes
+            result = {
+                "response": "".join(parts),
+                "sources": [],
+                "response_time": round(response_time, 2)
+            }
+            query_cache.set(cache_key, result, original_query=user_query)
+            
+            yield sse_event({
+                "done": True,
+                "sources": result["sources"],
+                "response_time": result["response_time"],
+                "cached": False,
+                "remaining_requests": remaining_requests
+            })
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+    
+    except Exception as e:
+        logger.error(f"Unexpected error in stream endpoint: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "An unexpected error occurred"
+        }), 500
+
+# Filesystem/index fields of /api/stats, rebuilt at most every STATS_TTL_SECONDS
+STATS_TTL_SECONDS = 5
+_stats_cache = {"ts": 0, "payload": None}
+
+def get_store_stats(rag_search):
+    """Vector store stats cached briefly so frequent polling doesn't stat the disk"""
+    now = time.monotonic()
+    if _stats_cache["payload"] is None or now - _stats_cache["ts"] > STATS_TTL_SECONDS:
+        faiss_path = os.path.join(Config.FAISS_STORE_DIR, "faiss.index")
+        # Memory-mapped chunk offsets, or a legacy pickle before first load converts it
+        meta_paths = [
+            os.path.join(Config.FAISS_STORE_DIR, "offsets.npy"),
+            os.path.join(Config.FAISS_STORE_DIR, "metadata.pkl")
+        ]
+        
+        # Get number of documents
+        num_chunks = 0
+        if rag_search and rag_search.vectorstore.index:
+            num_chunks = rag_search.vectorstore.index.ntotal
+        
+        _stats_cache["payload"] = {
+            "vector_store_loaded": os.path.exists(faiss_path) and any(map(os.path.exists, meta_paths)),
+            "num_document_chunks": num_chunks,
+            "embedding_model": Config.EMBEDDING_MODEL,
+            "llm_model": Config.LLM_MODEL
+        }
+        _stats_cache["ts"] = now
+    return _stats_cache["payload"]
+
+def invalidate_store_stats():
+    """Drop the cached store stats (e.g. after the index is rebuilt)"""
+    _stats_cache["payload"] = None
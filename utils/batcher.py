@@ -0,0 +1,105 @@
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+# Queued by close() (or when a batcher is garbage collected) to stop its worker
+_STOP = object()
+
+# Live batchers, held weakly so the fork hook never keeps one (or its owner) alive
+_batchers = weakref.WeakSet()
+
+def _reset_after_fork():
+    for batcher in list(_batchers):
+        batcher._reset()
+
+# Threads don't survive fork (gunicorn --preload): start a fresh worker in each child
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _run(batcher_ref, work_queue: queue.Queue):
+    """Worker loop; only holds the batcher while a batch is being processed"""
+    while True:
+        first = work_queue.get()
+        if first is _STOP:
+            return
+        batcher = batcher_ref()
+        if batcher is None:
+            first[1].set_exception(RuntimeError("MicroBatcher was garbage collected"))
+            return
+        batcher._process(batcher._next_batch(first))
+        del batcher
+
+class MicroBatcher:
+    """Collect concurrent submissions into small batches processed by one worker thread"""
+    
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 32, max_wait: float = 0.005):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._closed = False
+        self._reset()
+        _batchers.add(self)
+    
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+    
+    def submit(self, item: Any) -> Future:
+        """Queue an item; the returned Future resolves to its entry of the batch result"""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    # The worker gets a weak reference, so dropping the batcher stops it
+                    self._worker = threading.Thread(target=_run, args=(weakref.ref(self), self._queue), daemon=True)
+                    self._worker.start()
+                    weakref.finalize(self, self._queue.put, _STOP)
+        future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def close(self):
+        """Stop the worker thread once already-queued items are processed"""
+        with self._lock:
+            self._closed = True
+            if self._worker is not None:
+                self._queue.put(_STOP)
+                self._worker = None
+    
+    def _next_batch(self, first) -> list:
+        batch = [first]
+        # Keep draining until the wait window closes or the batch is full
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # Finish this batch first; the worker loop sees the stop next
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+    
+    def _process(self, batch: list):
+        try:
+            results = self.process_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # process_batch returns an exception instance for a request that failed on its own
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,53 +1,122 @@
-from functools import lru_cache
-import hashlib
-import json
-from typing import Any, Dict
+import threading
+import xxhash
+from collections import OrderedDict
+from typing import Any, Dict, Union
+
+# Sentinel for a cache miss, distinct from any stored value
+_MISS = object()
+
+# TinyLFU frequency sketch: SKETCH_DEPTH rows of SKETCH_WIDTH counters (power of two)
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 1024
 
 class QueryCache:
-    """Simple in-memory cache for query responses"""
+    """In-memory LRU cache for query responses with TinyLFU admission"""
     
     def __init__(self, max_size=100):
-        self.cache = {}
+        # key -> [original_query, response, access_count], least recently used first
+        self.cache = OrderedDict()
         self.max_size = max_size
-        self.access_count = {}
+        # Request threads share the cache; move_to_end/popitem must not interleave
+        self._lock = threading.Lock()
+        # Sum of access counts of the cached entries, kept current so stats are O(1)
+        self._total_accesses = 0
+        # Count-Min Sketch of recent key frequencies; a new key only displaces the
+        # LRU victim if it has been asked about more often
+        self._sketch = [[0] * SKETCH_WIDTH for _ in range(SKETCH_DEPTH)]
+        self._sketch_additions = 0
+        self._sketch_reset_at = 10 * max_size
+    
+    @staticmethod
+    def normalize(query: str) -> bytes:
+        """Case/whitespace-normalized UTF-8 form of a query"""
+        return " ".join(query.lower().split()).encode()
+    
+    @staticmethod
+    def make_key(query: Union[str, bytes]) -> int:
+        """Hash a query (or its normalize() bytes) into a 64-bit int key"""
+        if not isinstance(query, bytes):
+            query = QueryCache.normalize(query)
+        return xxhash.xxh3_64_intdigest(query)
     
-    def _get_key(self, query: str) -> str:
-        """Generate cache key from query"""
-        return hashlib.md5(query.lower().strip().encode()).hexdigest()
+    def _get_key(self, query: Union[str, bytes, int]) -> int:
+        """Generate cache key from query (int keys from make_key pass through)"""
+        if isinstance(query, int):
+            return query
+        return self.make_key(query)
     
-    def get(self, query: str) -> Any:
+    def _record(self, key: int):
+        """Count an access in the sketch, halving all counters periodically so old popularity fades"""
+        for row, sketch_row in enumerate(self._sketch):
+            sketch_row[(key >> (row * 16)) & (SKETCH_WIDTH - 1)] += 1
+        self._sketch_additions += 1
+        if self._sketch_additions >= self._sketch_reset_at:
+            for sketch_row in self._sketch:
+                sketch_row[:] = [count >> 1 for count in sketch_row]
+            self._sketch_additions //= 2
+    
+    def _frequency(self, key: int) -> int:
+        """Estimated access count; each row reads a different 16-bit slice of the 64-bit key"""
+        return min(
+            sketch_row[(key >> (row * 16)) & (SKETCH_WIDTH - 1)]
+            for row, sketch_row in enumerate(self._sketch)
+        )
+    
+    def get(self, query: Union[str, bytes, int]) -> Any:
         """Get cached response"""
         key = self._get_key(query)
-        if key in self.cache:
-            self.access_count[key] = self.access_count.get(key, 0) + 1
-            return self.cache[key]
-        return None
+        with self._lock:
+            self._record(key)
+            entry = self.cache.get(key, _MISS)
+            if entry is _MISS:
+                return None
+            self.cache.move_to_end(key)
+            entry[2] += 1
+            self._total_accesses += 1
+            return entry[1]
     
-    def set(self, query: str, response: Any):
-        """Cache response"""
+    def set(self, query: Union[str, bytes, int], response: Any, original_query: str = None):
+        """Cache response, keeping the original query text for debugging"""
         key = self._get_key(query)
+        if original_query is None and isinstance(query, str):
+            original_query = query
         
-        # Remove least accessed item if cache is full
-        if len(self.cache) >= self.max_size and key not in self.cache:
-            least_used = min(self.access_count.items(), key=lambda x: x[1])[0]
-            del self.cache[least_used]
-            del self.access_count[least_used]
-        
-        self.cache[key] = response
-        self.access_count[key] = 1
+        with self._lock:
+            self._record(key)
+            entry = self.cache.get(key, _MISS)
+            if entry is not _MISS:
+                entry[1] = response
+                self.cache.move_to_end(key)
+                return
+            
+            # When full, admit the new key only if it is more popular than the LRU victim
+            if len(self.cache) >= self.max_size:
+                victim = next(iter(self.cache))
+                if self._frequency(key) <= self._frequency(victim):
+                    return
+                _, evicted = self.cache.popitem(last=False)
+                self._total_accesses -= evicted[2]
+            
+            self.cache[key] = [original_query, response, 1]
+            self._total_accesses += 1
     
     def clear(self):
         """Clear cache"""
-        self.cache.clear()
-        self.access_count.clear()
+        with self._lock:
+            self.cache.clear()
+            self._total_accesses = 0
+            for sketch_row in self._sketch:
+                sketch_row[:] = [0] * SKETCH_WIDTH
+            self._sketch_additions = 0
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        return {
-            "size": len(self.cache),
-            "max_size": self.max_size,
-            "total_accesses": sum(self.access_count.values())
-        }
+        with self._lock:
+            return {
+                "size": len(self.cache),
+                "max_size": self.max_size,
+                "total_accesses": self._total_accesses
+            }
 
 # Global cache instance
 query_cache = QueryCache(max_size=100)
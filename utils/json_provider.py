@@ -0,0 +1,12 @@
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (also used by request.get_json)"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        # Fall back to Flask's default() for dates, UUIDs, dataclasses, etc.
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
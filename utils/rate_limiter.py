@@ -1,49 +1,103 @@
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Dict
+import itertools
+import threading
+import time
+from typing import Dict, List, Tuple
+import xxhash
 from config import Config
 
+# Clients are spread over independently locked shards (power of two)
+NUM_SHARDS = 1024
+
+# Idle clients are dropped every this many checks
+SWEEP_INTERVAL = 1024
+
 class RateLimiter:
-    """Simple rate limiter to prevent API abuse"""
+    """Sliding-window-counter rate limiter to prevent API abuse"""
     
     def __init__(self, max_requests=30, window_seconds=60):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests: Dict[str, list] = defaultdict(list)
-    
-    def is_allowed(self, client_id: str) -> bool:
-        """Check if request is allowed for client"""
+        # Per client: [previous window count, current window count, current window number],
+        # updated in place. Constant memory per client instead of one timestamp per request.
+        self._shards: List[Dict[str, List]] = [{} for _ in range(NUM_SHARDS)]
+        # Lock striping: concurrent requests only contend when their IPs share a shard
+        self._locks = [threading.Lock() for _ in range(NUM_SHARDS)]
+        # next() on itertools.count is atomic under the GIL
+        self._calls = itertools.count(1)
+        # Config is fixed at startup; when limiting is off, skip all bookkeeping per request
         if not Config.RATE_LIMIT_ENABLED:
-            return True
-        
-        now = datetime.now()
-        window_start = now - timedelta(seconds=self.window_seconds)
-        
-        # Clean old requests
-        self.requests[client_id] = [
-            req_time for req_time in self.requests[client_id]
-            if req_time > window_start
-        ]
+            self.check = self._allow_all
+            self.is_allowed = self._allow_all_bool
+    
+    def _shard_for(self, client_id: str) -> int:
+        return xxhash.xxh3_64_intdigest(str(client_id).encode()) & (NUM_SHARDS - 1)
+    
+    def _roll(self, state: List, now: float) -> float:
+        """Advance a client's counters to now in place; returns the approx in-window count"""
+        current_window, offset = divmod(now, self.window_seconds)
+        current_window = int(current_window)
+        if current_window != state[2]:
+            # One window later the current count becomes the previous one; after that both are stale
+            state[0] = state[1] if current_window == state[2] + 1 else 0
+            state[1] = 0
+            state[2] = current_window
+        # Weight the previous window by how much of it still overlaps the sliding window
+        return state[0] * (1 - offset / self.window_seconds) + state[1]
+    
+    def _sweep(self, current_window: int):
+        """Forget clients whose counters have fully aged out, one shard lock at a time"""
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                idle = [cid for cid, (_, _, window) in shard.items() if window < current_window - 1]
+                for cid in idle:
+                    del shard[cid]
+    
+    def _allow_all(self, client_id: str) -> Tuple[bool, int]:
+        return True, self.max_requests
+    
+    def _allow_all_bool(self, client_id: str) -> bool:
+        return True
+    
+    def check(self, client_id: str, _now=time.monotonic, _next=next) -> Tuple[bool, int]:
+        """Record a request for client; returns (allowed, remaining requests)"""
+        # _now/_next are bound as defaults so the hot path uses fast locals, not global lookups
+        # Monotonic seconds: cheap float compares, unaffected by wall-clock jumps
+        now = _now()
+        current_window = int(now // self.window_seconds)
+        shard = self._shard_for(client_id)
         
-        # Check limit
-        if len(self.requests[client_id]) >= self.max_requests:
-            return False
+        if _next(self._calls) % SWEEP_INTERVAL == 0:
+            self._sweep(current_window)
         
-        # Add current request
-        self.requests[client_id].append(now)
-        return True
+        with self._locks[shard]:
+            state = self._shards[shard].get(client_id)
+            if state is None:
+                state = self._shards[shard][client_id] = [0, 0, current_window]
+            approx = self._roll(state, now)
+            
+            # Check limit
+            if approx >= self.max_requests:
+                return False, 0
+            
+            # Count current request
+            state[1] += 1
+            return True, max(0, int(self.max_requests - approx - 1))
+    
+    def is_allowed(self, client_id: str) -> bool:
+        """Check if request is allowed for client"""
+        return self.check(client_id)[0]
     
-    def get_remaining(self, client_id: str) -> int:
+    def get_remaining(self, client_id: str, _now=time.monotonic) -> int:
         """Get remaining requests for client"""
-        now = datetime.now()
-        window_start = now - timedelta(seconds=self.window_seconds)
+        shard = self._shard_for(client_id)
         
-        recent_requests = [
-            req_time for req_time in self.requests.get(client_id, [])
-            if req_time > window_start
-        ]
+        with self._locks[shard]:
+            state = self._shards[shard].get(client_id)
+            if state is None:
+                return self.max_requests
+            approx = self._roll(state, _now())
         
-        return max(0, self.max_requests - len(recent_requests))
+        return max(0, int(self.max_requests - approx))
 
 # Global rate limiter instance
 rate_limiter = RateLimiter(
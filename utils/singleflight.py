@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into a single execution"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+    
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float = None) -> Tuple[Any, bool]:
+        """Run fn once for all concurrent callers of key; returns (result, shared)
+
+        A follower that waits longer than timeout runs fn itself instead of failing.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+        
+        # Followers block on the leader's result (or its exception)
+        if not is_leader:
+            try:
+                return future.result(timeout=timeout), True
+            except FutureTimeout:
+                # The leader is legitimately slow (retrieval + LLM); don't fail this caller for it
+                return fn(), False
+        
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+# Global in-flight query map
+query_flight = SingleFlight()
@@ -0,0 +1,28 @@
+import threading
+from typing import Dict
+
+class QueryStats:
+    """Request counters shared by all request threads of a worker"""
+    
+    def __init__(self):
+        # `counters[name] += n` is a separate load, add and store; the lock keeps
+        # concurrent requests from losing each other's updates
+        self._lock = threading.Lock()
+        self._counters = {
+            "total_queries": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            # Integer nanoseconds; the average is derived when /api/stats is read
+            "total_response_ns": 0
+        }
+    
+    def add(self, **deltas: int):
+        """Apply several counter increments as one update"""
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] += delta
+    
+    def snapshot(self) -> Dict[str, int]:
+        """Consistent copy of all counters"""
+        with self._lock:
+            return dict(self._counters)